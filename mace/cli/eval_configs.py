@@ -13,6 +13,9 @@ import torch
 
 from mace import data
 from mace.tools import torch_geometric, torch_tools, utils
+from mace.tools.compile import prepare
+from mace.tools.inference_utils import optimize_for_inference, prefetch_to_device
+from mace.tools.scripts_utils import extract_load
 
 
 def parse_args() -> argparse.Namespace:
@@ -34,7 +37,33 @@ def parse_args() -> argparse.Namespace:
         choices=["float32", "float64"],
         default="float64",
     )
+    parser.add_argument(
+        "--matmul_precision",
+        help="precision of float32 matmuls, 'high' allows TF32 on recent NVIDIA GPUs",
+        type=str,
+        choices=["highest", "high", "medium"],
+        default="highest",
+    )
+    parser.add_argument(
+        "--compile_mode",
+        help="compile the model with torch.compile using this mode",
+        type=str,
+        choices=["default", "reduce-overhead", "max-autotune"],
+        default=None,
+    )
+    parser.add_argument(
+        "--optimize",
+        help="rewrite the model with optimize_for_inference before evaluating it",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument("--batch_size", help="batch size", type=int, default=64)
+    parser.add_argument(
+        "--num_workers",
+        help="number of workers preparing batches in the background",
+        type=int,
+        default=0,
+    )
     parser.add_argument(
         "--compute_stress",
         help="compute stress",
@@ -53,16 +82,24 @@ def parse_args() -> argparse.Namespace:
         type=str,
         default="MACE_",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.compile_mode is not None and args.compute_stress:
+        # Same restriction as the compiled MACECalculator
+        parser.error("--compute_stress is not supported together with --compile_mode")
+    return args
 
 
 def main():
     args = parse_args()
     torch_tools.set_default_dtype(args.default_dtype)
+    torch.set_float32_matmul_precision(args.matmul_precision)
     device = torch_tools.init_device(args.device)
 
     # Load model
-    model = torch.load(f=args.model, map_location=args.device)
+    if args.compile_mode is not None:
+        model = prepare(extract_load)(f=args.model, map_location=args.device)
+    else:
+        model = torch.load(f=args.model, map_location=args.device)
     model = model.to(
         args.device
     )  # shouldn't be necessary but seems to help with CUDA problems
@@ -70,6 +107,13 @@ def main():
     for param in model.parameters():
         param.requires_grad = False
 
+    if args.optimize:
+        model = optimize_for_inference(model)
+
+    if args.compile_mode is not None:
+        # Compiled lazily by the first batch, batches of a new shape recompile
+        model = torch.compile(model, mode=args.compile_mode, fullgraph=True)
+
     # Load data and prepare input
     atoms_list = ase.io.read(args.configs, index=":")
     configs = [data.config_from_atoms(atoms) for atoms in atoms_list]
@@ -86,6 +130,9 @@ def main():
         batch_size=args.batch_size,
         shuffle=False,
         drop_last=False,
+        pin_memory=device.type == "cuda",
+        num_workers=args.num_workers,
+        persistent_workers=args.num_workers > 0,
     )
 
     # Collect data
@@ -94,9 +141,16 @@ def main():
     stresses_list = []
     forces_collection = []
 
-    for batch in data_loader:
-        batch = batch.to(device)
-        output = model(batch.to_dict(), compute_stress=args.compute_stress)
+    for batch in prefetch_to_device(data_loader, device):
+        batch_dict = batch.to_dict()
+        if args.compile_mode is not None:
+            batch_dict["node_attrs"].requires_grad_(True)
+            batch_dict["positions"].requires_grad_(True)
+        output = model(
+            batch_dict,
+            compute_stress=args.compute_stress,
+            training=args.compile_mode is not None,
+        )
         energies_list.append(torch_tools.to_numpy(output["energy"]))
         if args.compute_stress:
             stresses_list.append(torch_tools.to_numpy(output["stress"]))
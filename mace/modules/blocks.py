@@ -14,6 +14,7 @@ from e3nn.util.jit import compile_mode
 
 from mace.tools.compile import simplify_if_compile
 from mace.tools.scatter import scatter_sum
+from mace.tools.torch_tools import get_side_stream
 
 from .irreps_tools import (
     linear_out_irreps,
@@ -225,7 +226,8 @@ class EquivariantProductBasisBlock(torch.nn.Module):
     ) -> torch.Tensor:
         node_feats = self.symmetric_contractions(node_feats, node_attrs)
         if self.use_sc and sc is not None:
-            return self.linear(node_feats) + sc
+            # Accumulate into the fresh linear output instead of allocating the sum
+            return self.linear(node_feats).add_(sc)
         return self.linear(node_feats)
 
 
@@ -260,6 +262,64 @@ class InteractionBlock(torch.nn.Module):
     def _setup(self) -> None:
         raise NotImplementedError
 
+    def aggregate(
+        self,
+        mji: torch.Tensor,  # [n_edges, irreps]
+        receiver: torch.Tensor,
+        num_nodes: int,
+    ) -> torch.Tensor:  # [n_nodes, irreps]
+        if hasattr(self, "edge_csr"):
+            # [n_nodes, n_edges] CSR adjacency set per batch for inference, see
+            # mace.tools.inference_utils.edge_index_to_csr
+            return torch.mm(self.edge_csr, mji)
+        return scatter_sum(src=mji, index=receiver, dim=0, dim_size=num_nodes)
+
+    def convolve(
+        self,
+        node_feats: torch.Tensor,  # [n_nodes, irreps]
+        edge_attrs: torch.Tensor,
+        tp_weights: torch.Tensor,
+        sender: torch.Tensor,
+        receiver: torch.Tensor,
+        num_nodes: int,
+    ) -> torch.Tensor:  # [n_nodes, irreps]
+        if hasattr(self, "conv_fusion"):
+            # Fused tensor product and neighbour sum, see
+            # mace.tools.inference_utils.oeq_conv_from_e3nn
+            return self.conv_fusion(
+                node_feats, edge_attrs, tp_weights, receiver, sender
+            )
+        mji = self.conv_tp(
+            node_feats[sender], edge_attrs, tp_weights
+        )  # [n_edges, irreps]
+        return self.aggregate(mji, receiver, num_nodes)
+
+    def normalize_by_neighbors(self, message: torch.Tensor) -> torch.Tensor:
+        if self.avg_num_neighbors != 1.0:
+            return message / self.avg_num_neighbors
+        # Already folded into the weights of self.linear, see
+        # mace.tools.inference_utils.fold_avg_num_neighbors
+        return message
+
+    def linear_up_and_tp_weights(
+        self,
+        node_feats: torch.Tensor,
+        edge_feats: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        if hasattr(self, "use_side_stream"):
+            # The node and edge branches are independent, overlap them on two CUDA
+            # streams, see mace.tools.inference_utils.optimize_for_inference
+            main_stream = torch.cuda.current_stream(node_feats.device)
+            side_stream = get_side_stream(node_feats.device)
+            side_stream.wait_stream(main_stream)
+            with torch.cuda.stream(side_stream):
+                tp_weights = self.conv_tp_weights(edge_feats)
+            node_feats = self.linear_up(node_feats)
+            main_stream.wait_stream(side_stream)
+            tp_weights.record_stream(main_stream)
+            return node_feats, tp_weights
+        return self.linear_up(node_feats), self.conv_tp_weights(edge_feats)
+
     @abstractmethod
     def forward(
         self,
@@ -357,13 +417,10 @@ class ResidualElementDependentInteractionBlock(InteractionBlock):
         sc = self.skip_tp(node_feats, node_attrs)
         node_feats = self.linear_up(node_feats)
         tp_weights = self.conv_tp_weights(node_attrs[sender], edge_feats)
-        mji = self.conv_tp(
-            node_feats[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        message = self.convolve(
+            node_feats, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         return message + sc  # [n_nodes, irreps]
 
 
@@ -420,15 +477,11 @@ class AgnosticNonlinearInteractionBlock(InteractionBlock):
         sender = edge_index[0]
         receiver = edge_index[1]
         num_nodes = node_feats.shape[0]
-        tp_weights = self.conv_tp_weights(edge_feats)
-        node_feats = self.linear_up(node_feats)
-        mji = self.conv_tp(
-            node_feats[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        node_feats, tp_weights = self.linear_up_and_tp_weights(node_feats, edge_feats)
+        message = self.convolve(
+            node_feats, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         message = self.skip_tp(message, node_attrs)
         return message  # [n_nodes, irreps]
 
@@ -488,15 +541,11 @@ class AgnosticResidualNonlinearInteractionBlock(InteractionBlock):
         receiver = edge_index[1]
         num_nodes = node_feats.shape[0]
         sc = self.skip_tp(node_feats, node_attrs)
-        node_feats = self.linear_up(node_feats)
-        tp_weights = self.conv_tp_weights(edge_feats)
-        mji = self.conv_tp(
-            node_feats[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        node_feats, tp_weights = self.linear_up_and_tp_weights(node_feats, edge_feats)
+        message = self.convolve(
+            node_feats, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         message = message + sc
         return message  # [n_nodes, irreps]
 
@@ -557,15 +606,11 @@ class RealAgnosticInteractionBlock(InteractionBlock):
         sender = edge_index[0]
         receiver = edge_index[1]
         num_nodes = node_feats.shape[0]
-        node_feats = self.linear_up(node_feats)
-        tp_weights = self.conv_tp_weights(edge_feats)
-        mji = self.conv_tp(
-            node_feats[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        node_feats, tp_weights = self.linear_up_and_tp_weights(node_feats, edge_feats)
+        message = self.convolve(
+            node_feats, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         message = self.skip_tp(message, node_attrs)
         return (
             self.reshape(message),
@@ -630,15 +675,11 @@ class RealAgnosticResidualInteractionBlock(InteractionBlock):
         receiver = edge_index[1]
         num_nodes = node_feats.shape[0]
         sc = self.skip_tp(node_feats, node_attrs)
-        node_feats = self.linear_up(node_feats)
-        tp_weights = self.conv_tp_weights(edge_feats)
-        mji = self.conv_tp(
-            node_feats[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        node_feats, tp_weights = self.linear_up_and_tp_weights(node_feats, edge_feats)
+        message = self.convolve(
+            node_feats, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         return (
             self.reshape(message),
             sc,
@@ -725,13 +766,10 @@ class RealAgnosticAttResidualInteractionBlock(InteractionBlock):
             dim=-1,
         )
         tp_weights = self.conv_tp_weights(augmented_edge_feats)
-        mji = self.conv_tp(
-            node_feats_up[sender], edge_attrs, tp_weights
-        )  # [n_edges, irreps]
-        message = scatter_sum(
-            src=mji, index=receiver, dim=0, dim_size=num_nodes
+        message = self.convolve(
+            node_feats_up, edge_attrs, tp_weights, sender, receiver, num_nodes
         )  # [n_nodes, irreps]
-        message = self.linear(message) / self.avg_num_neighbors
+        message = self.normalize_by_neighbors(self.linear(message))
         return (
             self.reshape(message),
             sc,
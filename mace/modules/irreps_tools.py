@@ -75,6 +75,12 @@ class reshape_irreps(torch.nn.Module):
             self.muls.append(mul)
 
     def forward(self, tensor: torch.Tensor) -> torch.Tensor:
+        if hasattr(self, "gather_index"):
+            # Single gather precomputed for inference, see
+            # mace.tools.inference_utils.specialize_reshape_irreps
+            return tensor.index_select(-1, self.gather_index).view(
+                tensor.shape[0], self.muls[0], -1
+            )
         ix = 0
         out = []
         batch, _ = tensor.shape
@@ -200,9 +200,6 @@ class MACE(torch.nn.Module):
 
         # Atomic energies
         node_e0 = self.atomic_energies_fn(data["node_attrs"])
-        e0 = scatter_sum(
-            src=node_e0, index=data["batch"], dim=-1, dim_size=num_graphs
-        )  # [n_graphs,]
         # Embeddings
         node_feats = self.node_embedding(data["node_attrs"])
         vectors, lengths = get_edge_vectors_and_lengths(
@@ -218,15 +215,10 @@ class MACE(torch.nn.Module):
             pair_node_energy = self.pair_repulsion_fn(
                 lengths, data["node_attrs"], data["edge_index"], self.atomic_numbers
             )
-            pair_energy = scatter_sum(
-                src=pair_node_energy, index=data["batch"], dim=-1, dim_size=num_graphs
-            )  # [n_graphs,]
         else:
             pair_node_energy = torch.zeros_like(node_e0)
-            pair_energy = torch.zeros_like(e0)
 
         # Interactions
-        energies = [e0, pair_energy]
         node_energies_list = [node_e0, pair_node_energy]
         node_feats_list = []
         for interaction, product, readout in zip(
@@ -246,19 +238,22 @@ class MACE(torch.nn.Module):
             )
             node_feats_list.append(node_feats)
             node_energies = readout(node_feats).squeeze(-1)  # [n_nodes, ]
-            energy = scatter_sum(
-                src=node_energies, index=data["batch"], dim=-1, dim_size=num_graphs
-            )  # [n_graphs,]
-            energies.append(energy)
             node_energies_list.append(node_energies)
 
         # Concatenate node features
         node_feats_out = torch.cat(node_feats_list, dim=-1)
 
-        # Sum over energy contributions
-        contributions = torch.stack(energies, dim=-1)
+        # Sum over energy contributions, a single scatter for all of them
+        node_energy_contributions = torch.stack(
+            node_energies_list, dim=-1
+        )  # [n_nodes, n_contributions]
+        contributions = scatter_sum(
+            src=node_energy_contributions,
+            index=data["batch"],
+            dim=0,
+            dim_size=num_graphs,
+        )  # [n_graphs, n_contributions]
         total_energy = torch.sum(contributions, dim=-1)  # [n_graphs, ]
-        node_energy_contributions = torch.stack(node_energies_list, dim=-1)
         node_energy = torch.sum(node_energy_contributions, dim=-1)  # [n_nodes, ]
 
         # Outputs
@@ -491,9 +486,6 @@ class BOTNet(torch.nn.Module):
 
         # Atomic energies
         node_e0 = self.atomic_energies_fn(data.node_attrs)
-        e0 = scatter_sum(
-            src=node_e0, index=data.batch, dim=-1, dim_size=data.num_graphs
-        )  # [n_graphs,]
 
         # Embeddings
         node_feats = self.node_embedding(data.node_attrs)
@@ -506,7 +498,7 @@ class BOTNet(torch.nn.Module):
         )
 
         # Interactions
-        energies = [e0]
+        node_energies_list = [node_e0]
         for interaction, readout in zip(self.interactions, self.readouts):
             node_feats = interaction(
                 node_attrs=data.node_attrs,
@@ -516,13 +508,15 @@ class BOTNet(torch.nn.Module):
                 edge_index=data.edge_index,
             )
             node_energies = readout(node_feats).squeeze(-1)  # [n_nodes, ]
-            energy = scatter_sum(
-                src=node_energies, index=data.batch, dim=-1, dim_size=data.num_graphs
-            )  # [n_graphs,]
-            energies.append(energy)
+            node_energies_list.append(node_energies)
 
-        # Sum over energy contributions
-        contributions = torch.stack(energies, dim=-1)
+        # Sum over energy contributions, a single scatter for all of them
+        contributions = scatter_sum(
+            src=torch.stack(node_energies_list, dim=-1),
+            index=data.batch,
+            dim=0,
+            dim_size=data.num_graphs,
+        )  # [n_graphs, n_contributions]
         total_energy = torch.sum(contributions, dim=-1)  # [n_graphs, ]
 
         output = {
@@ -966,9 +960,6 @@ class EnergyDipolesMACE(torch.nn.Module):
 
         # Atomic energies
         node_e0 = self.atomic_energies_fn(data["node_attrs"])
-        e0 = scatter_sum(
-            src=node_e0, index=data["batch"], dim=-1, dim_size=num_graphs
-        )  # [n_graphs,]
 
         # Embeddings
         node_feats = self.node_embedding(data["node_attrs"])
@@ -983,7 +974,7 @@ class EnergyDipolesMACE(torch.nn.Module):
         )
 
         # Interactions
-        energies = [e0]
+        energies = [node_e0]  # per node, reduced to graphs in a single scatter
         node_energies_list = [node_e0]
         dipoles = []
         for interaction, product, readout in zip(
@@ -1004,15 +995,17 @@ class EnergyDipolesMACE(torch.nn.Module):
             node_out = readout(node_feats).squeeze(-1)  # [n_nodes, ]
             # node_energies = readout(node_feats).squeeze(-1)  # [n_nodes, ]
             node_energies = node_out[:, 0]
-            energy = scatter_sum(
-                src=node_energies, index=data["batch"], dim=-1, dim_size=num_graphs
-            )  # [n_graphs,]
-            energies.append(energy)
+            energies.append(node_energies)
             node_dipoles = node_out[:, 1:]
             dipoles.append(node_dipoles)
 
         # Compute the energies and dipoles
-        contributions = torch.stack(energies, dim=-1)
+        contributions = scatter_sum(
+            src=torch.stack(energies, dim=-1),
+            index=data["batch"],
+            dim=0,
+            dim_size=num_graphs,
+        )  # [n_graphs, n_contributions]
         total_energy = torch.sum(contributions, dim=-1)  # [n_graphs, ]
         node_energy_contributions = torch.stack(node_energies_list, dim=-1)
         node_energy = torch.sum(node_energy_contributions, dim=-1)  # [n_nodes, ]
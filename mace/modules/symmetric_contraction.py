@@ -216,6 +216,17 @@ class Contraction(torch.nn.Module):
             x,
             y,
         )
+        if hasattr(self, "weightings"):
+            # Weightings contracted per element ahead of time and packed into one
+            # matrix, see mace.tools.inference_utils.precompute_contraction_weightings
+            c_tensors = torch.matmul(y, self.weightings)
+            for i, contract_features in enumerate(self.contractions_features):
+                c_tensor = c_tensors[
+                    :, self.weightings_offsets[i] : self.weightings_offsets[i + 1]
+                ].view([y.shape[0]] + self.weightings_shapes[i])
+                c_tensor = c_tensor + out
+                out = contract_features(c_tensor, x)
+            return out.view(out.shape[0], -1)
         for i, (weight, contract_weights, contract_features) in enumerate(
             zip(self.weights, self.contractions_weighting, self.contractions_features)
         ):
@@ -68,7 +68,7 @@ def compute_forces_virials(
     if forces is None:
         forces = torch.zeros_like(positions)
     if virials is None:
-        virials = torch.zeros((1, 3, 3))
+        virials = torch.zeros_like(displacement)
 
     return -1 * forces, -1 * virials, stress
 
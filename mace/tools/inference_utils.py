@@ -0,0 +1,494 @@
+###########################################################################################
+# Utilities for fast MACE inference
+# This program is distributed under the MIT License (see MIT.md)
+###########################################################################################
+
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import torch
+from e3nn import o3
+
+from mace.modules.blocks import (
+    AgnosticNonlinearInteractionBlock,
+    AgnosticResidualNonlinearInteractionBlock,
+    RealAgnosticInteractionBlock,
+    RealAgnosticResidualInteractionBlock,
+)
+from mace.tools.torch_geometric.batch import Batch
+from mace.tools.torch_tools import TensorDict
+
+OEQ_URL = "https://github.com/PASSIONLab/OpenEquivariance"
+
+# Interactions computing linear_up and the radial MLP through
+# InteractionBlock.linear_up_and_tp_weights, which can overlap them on a side stream
+STREAMED_INTERACTIONS = (
+    AgnosticNonlinearInteractionBlock,
+    AgnosticResidualNonlinearInteractionBlock,
+    RealAgnosticInteractionBlock,
+    RealAgnosticResidualInteractionBlock,
+)
+
+
+def _import_openequivariance():
+    try:
+        import openequivariance as oeq  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise RuntimeError(
+            f"Please install openequivariance to use the fused convolution kernels (see {OEQ_URL})"
+        ) from exc
+    return oeq
+
+
+def oeq_conv_from_e3nn(
+    conv_tp: o3.TensorProduct, dtype: torch.dtype = torch.float32
+) -> torch.nn.Module:
+    """Build an OpenEquivariance fused convolution matching an e3nn tensor product.
+
+    The returned module is called as ``conv(node_feats, edge_attrs, tp_weights,
+    receiver, sender)`` and computes the tensor product on every edge together with
+    the sum over the neighbours of each receiver in one kernel, without materialising
+    the ``[n_edges, irreps]`` messages.
+    """
+    oeq = _import_openequivariance()
+    np_dtype = np.float64 if dtype == torch.float64 else np.float32
+    instructions = [
+        (ins.i_in1, ins.i_in2, ins.i_out, ins.connection_mode, ins.has_weight)
+        for ins in conv_tp.instructions
+    ]
+    problem = oeq.TPProblem(
+        oeq.Irreps(str(conv_tp.irreps_in1)),
+        oeq.Irreps(str(conv_tp.irreps_in2)),
+        oeq.Irreps(str(conv_tp.irreps_out)),
+        instructions,
+        shared_weights=False,
+        internal_weights=False,
+        irrep_dtype=np_dtype,
+        weight_dtype=np_dtype,
+    )
+    return oeq.TensorProductConv(problem, torch_op=True, deterministic=False)
+
+
+def _tp_signature(conv_tp: o3.TensorProduct) -> Tuple:
+    """Hashable description of the irreps and paths of a tensor product, identical
+    for layers that can share one compiled convolution kernel"""
+    return (
+        str(conv_tp.irreps_in1),
+        str(conv_tp.irreps_in2),
+        str(conv_tp.irreps_out),
+        tuple(
+            (ins.i_in1, ins.i_in2, ins.i_out, ins.connection_mode, ins.has_weight)
+            for ins in conv_tp.instructions
+        ),
+    )
+
+
+class LinearMatmul(torch.nn.Module):
+    """Dense GEMM equivalent of an ``o3.Linear`` acting on scalar irreps only.
+
+    The e3nn weights, including their path normalisation, are materialised once as a
+    contiguous ``[dim_out, dim_in]`` matrix in the ``torch.nn.Linear`` layout, so that
+    the forward pass is a single ``F.linear`` (cuBLAS GEMM, and a pattern that
+    Inductor can fuse surrounding pointwise ops into). The weights can optionally be
+    stored in a lower precision such as ``torch.bfloat16`` to halve the weight
+    traffic, in which case the inputs are cast for the GEMM and the result is cast
+    back.
+    """
+
+    weight: torch.Tensor
+
+    def __init__(self, linear: o3.Linear, dtype: Optional[torch.dtype] = None):
+        super().__init__()
+        self.irreps_in = linear.irreps_in
+        self.irreps_out = linear.irreps_out
+        with torch.no_grad():
+            eye = torch.eye(
+                linear.irreps_in.dim,
+                dtype=linear.weight.dtype,
+                device=linear.weight.device,
+            )
+            weight_t = linear(eye).T
+            # one copy into the contiguous layout and storage dtype, rather than a
+            # cast followed by a second contiguous copy
+            weight = torch.empty(
+                weight_t.shape,
+                dtype=dtype if dtype is not None else weight_t.dtype,
+                device=weight_t.device,
+            ).copy_(weight_t)
+        # a buffer rather than a parameter so that a low precision copy does not
+        # change the dtype reported by the model parameters
+        self.register_buffer("weight", weight)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.nn.functional.linear(x.to(self.weight.dtype), self.weight).to(
+            x.dtype
+        )
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.irreps_in} -> {self.irreps_out})"
+
+
+def replace_scalar_linears(
+    module: torch.nn.Module, dtype: Optional[torch.dtype] = None
+) -> torch.nn.Module:
+    """Recursively replace every bias-free ``o3.Linear`` between scalar irreps by a
+    ``LinearMatmul``."""
+    for name, child in module.named_children():
+        if (
+            isinstance(child, o3.Linear)
+            and child.irreps_in.lmax == 0
+            and child.irreps_out.lmax == 0
+            and child.bias.numel() == 0
+        ):
+            setattr(module, name, LinearMatmul(child, dtype=dtype))
+        else:
+            replace_scalar_linears(child, dtype=dtype)
+    return module
+
+
+class LowPrecisionSphericalHarmonics(torch.nn.Module):
+    """Evaluates spherical harmonics in a lower precision dtype.
+
+    The spherical harmonics are a few pointwise polynomials per edge, bound by the
+    memory traffic over the edge vectors, so evaluating them in half precision
+    roughly halves their cost. The result is cast back to the dtype of the input.
+    Note that ``torch.bfloat16`` has an absolute error of order 1e-2 on the
+    harmonics, ``torch.float16`` of order 1e-3.
+    """
+
+    def __init__(self, spherical_harmonics: o3.SphericalHarmonics, dtype: torch.dtype):
+        super().__init__()
+        self.spherical_harmonics = spherical_harmonics
+        self.dtype = dtype
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.spherical_harmonics(x.to(self.dtype)).to(x.dtype)
+
+
+def fuse_spherical_harmonics(
+    spherical_harmonics: o3.SphericalHarmonics,
+) -> torch.nn.Module:
+    """Compile the normalisation of the edge vectors and the spherical harmonics
+    polynomials into a single fused kernel.
+
+    Both are pointwise over the edges, so inductor generates one kernel that reads
+    every edge vector once instead of one kernel per operation. Dynamo traces through
+    the TorchScript polynomials of e3nn by inlining their Python source. The module
+    is compiled with dynamic shapes since the number of edges changes between
+    batches, and cannot be exported with TorchScript afterwards. The edge lengths
+    used by the radial embedding are still computed separately.
+    """
+    return torch.compile(spherical_harmonics, fullgraph=True, dynamic=True)
+
+
+def fold_avg_num_neighbors(interaction: torch.nn.Module) -> None:
+    """Fold the ``1 / avg_num_neighbors`` normalisation into the weights of the
+    linear layer following the convolution. ``avg_num_neighbors`` is set to 1.0,
+    which keeps the model (and any config extracted from it) consistent with its
+    weights and makes the interaction blocks skip the elementwise division over the
+    aggregated messages.
+    """
+    if interaction.avg_num_neighbors == 1.0:
+        return
+    with torch.no_grad():
+        interaction.linear.weight.div_(interaction.avg_num_neighbors)
+    interaction.avg_num_neighbors = 1.0
+
+
+def precompute_contraction_weightings(contraction: torch.nn.Module) -> None:
+    """Contract the product basis weights of a symmetric contraction with its U
+    matrices once per chemical element.
+
+    The weighting terms do not depend on the node features, so for frozen weights
+    they reduce to a ``[n_elements, ...]`` table. The tables of all correlation
+    orders are packed side by side into one contiguous ``[n_elements, n_total]``
+    matrix, so the forward pass combines them with the node attributes in a single
+    matmul instead of contracting the U matrices again for every node in every
+    layer.
+    """
+    eye = torch.eye(
+        contraction.weights_max.shape[0],
+        dtype=contraction.weights_max.dtype,
+        device=contraction.weights_max.device,
+    )
+    weightings = []
+    with torch.no_grad():
+        for i, (weight, contract_weights) in enumerate(
+            zip(contraction.weights, contraction.contractions_weighting)
+        ):
+            weighting = contract_weights(
+                contraction.U_tensors(contraction.correlation - i - 1), weight, eye
+            )
+            weightings.append(weighting)
+    if not weightings:  # correlation order 1, nothing to precompute
+        return
+    offsets = [0]
+    for weighting in weightings:
+        offsets.append(offsets[-1] + weighting[0].numel())
+    # derived from the weights, so kept out of the parameters and the state dict
+    contraction.register_buffer(
+        "weightings",
+        torch.cat([weighting.flatten(1) for weighting in weightings], dim=1),
+        persistent=False,
+    )
+    contraction.weightings_offsets = offsets
+    contraction.weightings_shapes = [list(w.shape[1:]) for w in weightings]
+
+
+def edge_index_to_csr(
+    edge_index: torch.Tensor, num_nodes: int, dtype: torch.dtype
+) -> torch.Tensor:
+    """Build the ``[n_nodes, n_edges]`` receiver adjacency of ``edge_index`` in CSR
+    format, so that the sum of messages over the neighbours of every node is one
+    row-parallel SpMM without atomics. The edges do not need to be sorted, and no
+    host synchronisation is required. The indices are stored in int32 whenever the
+    number of edges allows it, which halves the index traffic of the SpMM.
+    """
+    receiver = edge_index[1]
+    use_int32 = receiver.shape[0] < torch.iinfo(torch.int32).max
+    col_indices = torch.argsort(receiver, stable=True)
+    crow_indices = torch.searchsorted(
+        receiver[col_indices],
+        torch.arange(num_nodes + 1, dtype=receiver.dtype, device=receiver.device),
+        out_int32=use_int32,
+    )
+    if use_int32:
+        col_indices = col_indices.to(torch.int32)
+    values = torch.ones(receiver.shape[0], dtype=dtype, device=receiver.device)
+    return torch.sparse_csr_tensor(
+        crow_indices, col_indices, values, size=(num_nodes, receiver.shape[0])
+    )
+
+
+def _set_edge_csr(model: torch.nn.Module, args, kwargs) -> None:
+    """Forward pre-hook computing the CSR adjacency of a batch once, shared by all
+    interaction layers"""
+    data = args[0] if len(args) > 0 else kwargs["data"]
+    edge_csr = edge_index_to_csr(
+        data["edge_index"],
+        num_nodes=data["node_attrs"].shape[0],
+        dtype=data["node_attrs"].dtype,
+    )
+    for interaction in model.interactions:
+        interaction.edge_csr = edge_csr
+
+
+def _clear_edge_csr(
+    model: torch.nn.Module, args, output  # pylint: disable=W0613
+) -> None:
+    """Forward hook releasing the CSR adjacency of the batch, so that it is not kept
+    alive between calls nor copied or saved with the model"""
+    for interaction in model.interactions:
+        # a no-op if another registration of this hook already released it
+        interaction.__dict__.pop("edge_csr", None)
+
+
+def specialize_reshape_irreps(
+    reshape: torch.nn.Module,
+    device: Optional[torch.device] = None,
+    cache: Optional[Dict[str, torch.Tensor]] = None,
+) -> None:
+    """Replace the per-irrep slicing, reshaping and concatenation of a
+    ``reshape_irreps`` module by one gather with a precomputed index, so that the
+    ``[n_nodes, irreps] -> [n_nodes, channels, (lmax + 1)**2]`` reshape is a single
+    op whose indexing is fixed at optimization time. Modules sharing a ``cache``
+    reuse the same index tensor for identical irreps.
+    """
+    key = str(reshape.irreps)
+    if cache is not None and key in cache:
+        gather_index = cache[key]
+    else:
+        blocks = []
+        ix = 0
+        for mul, d in zip(reshape.muls, reshape.dims):
+            blocks.append(torch.arange(ix, ix + mul * d).view(mul, d))
+            ix += mul * d
+        gather_index = torch.cat(blocks, dim=-1).flatten().to(device)
+        if cache is not None:
+            cache[key] = gather_index
+    reshape.register_buffer("gather_index", gather_index, persistent=False)
+
+
+def optimize_for_inference(
+    model: torch.nn.Module,
+    use_oeq: bool = False,
+    linear_dtype: Optional[torch.dtype] = None,
+    csr_aggregation: bool = False,
+    sh_dtype: Optional[torch.dtype] = None,
+    use_streams: bool = False,
+    fuse_sh: bool = False,
+) -> torch.nn.Module:
+    """Rewrites a trained MACE model in place for faster inference.
+
+    The normalisation by the average number of neighbours is always folded into the
+    weights of the post-convolution linear layers, and the element dependent part of
+    the symmetric contractions is precomputed. Linear layers between scalar irreps
+    are replaced by single dense matmuls and the reshapes of the interaction outputs
+    by single gathers. None of these change the predictions; the
+    optional lower precision settings do.
+
+    Args:
+        model (torch.nn.Module): the model to optimize
+        use_oeq (bool, optional): replace the convolution tensor product and the
+            neighbour sum of every interaction by a fused OpenEquivariance kernel
+            (CUDA only). Defaults to False.
+        linear_dtype (torch.dtype, optional): dtype in which the weights of the scalar
+            linear layers are stored, e.g. ``torch.bfloat16``. Defaults to the model
+            dtype.
+        csr_aggregation (bool, optional): sum the messages over neighbours with a
+            CSR sparse-dense matmul built once per batch instead of a scatter.
+            Ignored when ``use_oeq`` is set. Defaults to False.
+        sh_dtype (torch.dtype, optional): dtype in which the spherical harmonics are
+            evaluated, e.g. ``torch.bfloat16``. Defaults to the model dtype.
+        use_streams (bool, optional): run the radial MLP of the interactions in
+            ``STREAMED_INTERACTIONS`` on a side CUDA stream, concurrently with the
+            first node linear. The stream is created on first use, so the model
+            can still be copied and saved. Defaults to False.
+        fuse_sh (bool, optional): compile the edge vector normalisation and the
+            spherical harmonics into one fused kernel with torch.compile, see
+            ``fuse_spherical_harmonics``. Defaults to False.
+
+    Returns:
+        torch.nn.Module: the optimized model
+    """
+    dtype = next(model.parameters()).dtype
+    device = next(model.parameters()).device
+    # Layers with identical irreps share one gather index and one compiled
+    # convolution kernel, which takes its weights as an input
+    reshape_cache: Dict[str, torch.Tensor] = {}
+    conv_cache: Dict[Tuple, torch.nn.Module] = {}
+    for interaction in model.interactions:
+        fold_avg_num_neighbors(interaction)
+        if hasattr(interaction, "reshape"):
+            specialize_reshape_irreps(
+                interaction.reshape, device=device, cache=reshape_cache
+            )
+        if use_streams and isinstance(interaction, STREAMED_INTERACTIONS):
+            interaction.use_side_stream = True
+        if use_oeq:
+            key = _tp_signature(interaction.conv_tp)
+            if key not in conv_cache:
+                conv_cache[key] = oeq_conv_from_e3nn(interaction.conv_tp, dtype=dtype)
+            interaction.conv_fusion = conv_cache[key]
+    if hasattr(model, "products"):  # BOTNet models have no product basis
+        for product in model.products:
+            for contraction in product.symmetric_contractions.contractions:
+                precompute_contraction_weightings(contraction)
+    replace_scalar_linears(model, dtype=linear_dtype)
+    if fuse_sh:
+        model.spherical_harmonics = fuse_spherical_harmonics(model.spherical_harmonics)
+    if sh_dtype is not None:
+        model.spherical_harmonics = LowPrecisionSphericalHarmonics(
+            model.spherical_harmonics, dtype=sh_dtype
+        )
+    if csr_aggregation and not use_oeq:
+        model.register_forward_pre_hook(_set_edge_csr, with_kwargs=True)
+        model.register_forward_hook(_clear_edge_csr)
+    return model
+
+
+class CUDAGraphModel:
+    """Replays a MACE forward pass that has been captured in a CUDA graph.
+
+    The graph is captured for the shapes of the example ``data``, so every call must
+    use inputs with exactly the same shapes (same number of atoms, edges and graphs).
+    Small systems are dominated by kernel launch overhead, which a single graph
+    replay removes. The returned tensors are static buffers that are overwritten by
+    the next call; clone them if they need to be kept.
+
+    Args:
+        model (torch.nn.Module): the model to capture, already on a CUDA device
+        data (TensorDict): example input, e.g. ``batch.to_dict()``
+        num_warmup (int, optional): warmup iterations on a side stream before
+            capture. Defaults to 3.
+        **forward_kwargs: keyword arguments forwarded to the model at capture time,
+            e.g. ``compute_stress=True``
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        data: TensorDict,
+        num_warmup: int = 3,
+        **forward_kwargs,
+    ):
+        self.model = model
+        self.static_inputs = {
+            key: value.detach().clone() if isinstance(value, torch.Tensor) else value
+            for key, value in data.items()
+        }
+
+        # Warmup on a side stream so that lazy initialisations (cuBLAS handles,
+        # autograd buffers, ...) are not recorded into the graph
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(num_warmup):
+                model(dict(self.static_inputs), **forward_kwargs)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph):
+            self.static_outputs: Dict[str, Optional[torch.Tensor]] = model(
+                dict(self.static_inputs), **forward_kwargs
+            )
+
+    def copy_inputs_(self, data: TensorDict) -> None:
+        """Copy ``data`` into the static input buffers of the graph"""
+        with torch.no_grad():
+            for key, buffer in self.static_inputs.items():
+                if not isinstance(buffer, torch.Tensor):
+                    continue
+                value = data[key]
+                if value.shape != buffer.shape:
+                    raise ValueError(
+                        f"Input '{key}' has shape {tuple(value.shape)} but the CUDA "
+                        f"graph was captured for shape {tuple(buffer.shape)}"
+                    )
+                buffer.copy_(value)
+
+    def replay(self) -> Dict[str, Optional[torch.Tensor]]:
+        """Replay the graph on the current content of the static input buffers"""
+        self.graph.replay()
+        return self.static_outputs
+
+    def __call__(self, data: TensorDict) -> Dict[str, Optional[torch.Tensor]]:
+        self.copy_inputs_(data)
+        return self.replay()
+
+
+def prefetch_to_device(data_loader: Iterable, device: torch.device) -> Iterator[Batch]:
+    """Iterate over ``data_loader`` with the batches already moved to ``device``.
+
+    On CUDA the copy of the next batch is issued on a separate stream while the
+    current batch is being evaluated, so that host to device transfers overlap with
+    compute. This only helps if the data loader uses ``pin_memory=True``, as copies
+    from pageable memory are synchronous.
+    """
+    device = torch.device(device)
+    if device.type != "cuda":
+        for batch in data_loader:
+            yield batch.to(device)
+        return
+
+    copy_stream = torch.cuda.Stream(device)
+
+    def _copy(batch):
+        with torch.cuda.stream(copy_stream):
+            return batch.to(device, non_blocking=True)
+
+    iterator = iter(data_loader)
+    next_batch = next(iterator, None)
+    if next_batch is not None:
+        next_batch = _copy(next_batch)
+    while next_batch is not None:
+        current_stream = torch.cuda.current_stream(device)
+        current_stream.wait_stream(copy_stream)
+        batch = next_batch
+        for _, value in batch:
+            if isinstance(value, torch.Tensor):
+                value.record_stream(current_stream)
+        next_batch = next(iterator, None)
+        if next_batch is not None:
+            next_batch = _copy(next_batch)
+        yield batch
@@ -40,6 +40,18 @@ def tensor_dict_to_device(td: TensorDict, device: torch.device) -> TensorDict:
     return {k: v.to(device) if v is not None else None for k, v in td.items()}
 
 
+_SIDE_STREAMS: Dict[torch.device, torch.cuda.Stream] = {}
+
+
+def get_side_stream(device: torch.device) -> torch.cuda.Stream:
+    """Returns a CUDA stream on ``device`` for work that overlaps with the current
+    stream. Created on first use and kept out of module state, since streams can
+    neither be pickled nor deep-copied."""
+    if device not in _SIDE_STREAMS:
+        _SIDE_STREAMS[device] = torch.cuda.Stream(device=device)
+    return _SIDE_STREAMS[device]
+
+
 def set_seeds(seed: int) -> None:
     np.random.seed(seed)
     torch.manual_seed(seed)
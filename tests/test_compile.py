@@ -12,6 +12,7 @@ from torch.testing import assert_close
 from mace import data, modules, tools
 from mace.tools import compile as mace_compile
 from mace.tools import torch_geometric
+from mace.tools.inference_utils import CUDAGraphModel
 
 table = tools.AtomicNumberTable([6])
 atomic_energies = np.array([1.0], dtype=float)
@@ -133,6 +134,38 @@ def test_compile_benchmark(benchmark, compile_mode, enable_amp):
             benchmark(model, batch, training=True)
 
 
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="cuda is not available")
+def test_cuda_graph(default_dtype):  # pylint: disable=W0621
+    print(f"using default dtype = {default_dtype}")
+    batch = create_batch("cuda")
+    model = create_mace("cuda")
+    for param in model.parameters():
+        param.requires_grad = False
+
+    expected = model(dict(batch), training=False)
+    graph_model = CUDAGraphModel(model, batch, training=False)
+    output = graph_model(batch)
+    assert_close(output["energy"], expected["energy"])
+    assert_close(output["forces"], expected["forces"])
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="cuda is not available")
+def test_cuda_graph_benchmark(benchmark, default_dtype):  # pylint: disable=W0621
+    print(f"using default dtype = {default_dtype}")
+    batch = create_batch("cuda")
+    model = create_mace("cuda")
+    for param in model.parameters():
+        param.requires_grad = False
+    graph_model = CUDAGraphModel(model, batch, training=False)
+
+    def step(data):
+        outputs = graph_model(data)
+        torch.cuda.synchronize()
+        return outputs
+
+    benchmark(step, batch)
+
+
 @pytest.mark.skipif(os.name == "nt", reason="Not supported on Windows")
 @pytest.mark.skipif(not torch.cuda.is_available(), reason="cuda is not available")
 def test_graph_breaks():
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import ase.io
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from ase import build
+from e3nn import o3
+
+from mace import modules, tools
+
+eval_configs = Path(__file__).parent.parent / "mace" / "cli" / "eval_configs.py"
+
+
+@pytest.fixture(name="model_path")
+def fixture_model_path(tmp_path):
+    table = tools.AtomicNumberTable([6])
+    with tools.torch_tools.default_dtype(torch.float64):
+        tools.torch_geometric.seed_everything(1702)
+        model = modules.ScaleShiftMACE(
+            r_max=5.0,
+            num_bessel=8,
+            num_polynomial_cutoff=6,
+            max_ell=2,
+            interaction_cls=modules.interaction_classes[
+                "RealAgnosticResidualInteractionBlock"
+            ],
+            interaction_cls_first=modules.interaction_classes[
+                "RealAgnosticResidualInteractionBlock"
+            ],
+            num_interactions=2,
+            num_elements=1,
+            hidden_irreps=o3.Irreps("16x0e + 16x1o"),
+            MLP_irreps=o3.Irreps("16x0e"),
+            gate=F.silu,
+            atomic_energies=np.array([1.0]),
+            avg_num_neighbors=8,
+            atomic_numbers=table.zs,
+            correlation=3,
+            radial_type="bessel",
+            atomic_inter_scale=1.5,
+            atomic_inter_shift=0.1,
+        )
+    path = tmp_path / "MACE.model"
+    torch.save(model, path)
+    return path
+
+
+def run_eval_configs(tmp_path, model_path, output, *flags):
+    # make sure eval_configs.py is using the mace that is currently being tested
+    run_env = os.environ.copy()
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    run_env["PYTHONPATH"] = ":".join(sys.path)
+
+    cmd = [
+        sys.executable,
+        str(eval_configs),
+        f"--configs={tmp_path / 'configs.xyz'}",
+        f"--model={model_path}",
+        f"--output={output}",
+        "--batch_size=2",
+        *flags,
+    ]
+    p = subprocess.run(cmd, env=run_env, check=True)
+    assert p.returncode == 0
+    return ase.io.read(output, index=":")
+
+
+def test_eval_configs_optimize(tmp_path, model_path):
+    configs = []
+    for seed in range(3):
+        atoms = build.bulk("C", "diamond", a=3.567, cubic=True)
+        atoms.rattle(stdev=0.1, seed=seed)
+        configs.append(atoms)
+    ase.io.write(tmp_path / "configs.xyz", configs)
+
+    reference = run_eval_configs(tmp_path, model_path, tmp_path / "ref.xyz")
+    optimized = run_eval_configs(
+        tmp_path, model_path, tmp_path / "opt.xyz", "--optimize"
+    )
+    for atoms_ref, atoms_opt in zip(reference, optimized):
+        np.testing.assert_allclose(
+            atoms_opt.info["MACE_energy"], atoms_ref.info["MACE_energy"], rtol=1e-6
+        )
+        np.testing.assert_allclose(
+            atoms_opt.arrays["MACE_forces"],
+            atoms_ref.arrays["MACE_forces"],
+            rtol=1e-6,
+            atol=1e-8,
+        )
@@ -0,0 +1,240 @@
+import io
+from copy import deepcopy
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from ase import build
+from e3nn import o3
+from torch.testing import assert_close
+
+from mace import data, modules, tools
+from mace.tools import torch_geometric
+from mace.tools.inference_utils import (
+    LinearMatmul,
+    edge_index_to_csr,
+    optimize_for_inference,
+    prefetch_to_device,
+)
+
+table = tools.AtomicNumberTable([6])
+atomic_energies = np.array([1.0], dtype=float)
+cutoff = 5.0
+
+
+def create_mace(device: str, seed: int = 1702):
+    torch_geometric.seed_everything(seed)
+
+    model_config = {
+        "r_max": cutoff,
+        "num_bessel": 8,
+        "num_polynomial_cutoff": 6,
+        "max_ell": 3,
+        "interaction_cls": modules.interaction_classes[
+            "RealAgnosticResidualInteractionBlock"
+        ],
+        "interaction_cls_first": modules.interaction_classes[
+            "RealAgnosticResidualInteractionBlock"
+        ],
+        "num_interactions": 2,
+        "num_elements": 1,
+        "hidden_irreps": o3.Irreps("32x0e + 32x1o"),
+        "MLP_irreps": o3.Irreps("16x0e"),
+        "gate": F.silu,
+        "atomic_energies": atomic_energies,
+        "avg_num_neighbors": 8,
+        "atomic_numbers": table.zs,
+        "correlation": 3,
+        "radial_type": "bessel",
+    }
+    model = modules.ScaleShiftMACE(
+        atomic_inter_scale=1.5, atomic_inter_shift=0.1, **model_config
+    )
+    return model.to(device)
+
+
+def create_batch(device: str, as_dict: bool = True):
+    atoms = build.bulk("C", "diamond", a=3.567, cubic=True)
+    atoms.rattle(stdev=0.1, seed=0)
+    data_loader = torch_geometric.dataloader.DataLoader(
+        dataset=[
+            data.AtomicData.from_config(
+                data.config_from_atoms(atoms), z_table=table, cutoff=cutoff
+            )
+        ],
+        batch_size=1,
+        shuffle=False,
+        drop_last=False,
+    )
+    batch = next(iter(data_loader)).to(device)
+    return batch.to_dict() if as_dict else batch
+
+
+@pytest.fixture(name="default_dtype", params=[torch.float32, torch.float64])
+def fixture_default_dtype(request):
+    with tools.torch_tools.default_dtype(request.param):
+        yield torch.get_default_dtype()
+
+
+def test_optimize_for_inference(default_dtype):
+    model = create_mace("cpu")
+    model_opt = optimize_for_inference(deepcopy(model))
+    for interaction in model_opt.interactions:
+        assert interaction.avg_num_neighbors == 1.0
+    assert isinstance(model_opt.node_embedding.linear, LinearMatmul)
+    assert isinstance(model_opt.interactions[0].linear_up, LinearMatmul)
+    assert (
+        model_opt.interactions[0].reshape.gather_index
+        is model_opt.interactions[1].reshape.gather_index
+    )
+
+    output = model(create_batch("cpu"))
+    output_opt = model_opt(create_batch("cpu"))
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+
+def test_optimize_botnet(default_dtype):
+    torch_geometric.seed_everything(1702)
+    model = modules.BOTNet(
+        r_max=cutoff,
+        num_bessel=8,
+        num_polynomial_cutoff=6,
+        max_ell=2,
+        interaction_cls=modules.interaction_classes[
+            "AgnosticNonlinearInteractionBlock"
+        ],
+        interaction_cls_first=modules.interaction_classes[
+            "AgnosticNonlinearInteractionBlock"
+        ],
+        num_interactions=2,
+        num_elements=1,
+        hidden_irreps=o3.Irreps("16x0e + 16x1o"),
+        MLP_irreps=o3.Irreps("16x0e"),
+        atomic_energies=atomic_energies,
+        gate=F.silu,
+        avg_num_neighbors=8,
+        atomic_numbers=table.zs,
+    )
+    model_opt = optimize_for_inference(deepcopy(model))
+
+    output = model(create_batch("cpu", as_dict=False))
+    output_opt = model_opt(create_batch("cpu", as_dict=False))
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+
+def test_optimize_csr_aggregation(default_dtype):
+    model = create_mace("cpu")
+    model_opt = optimize_for_inference(deepcopy(model), csr_aggregation=True)
+
+    # optimizing twice registers the CSR hooks twice
+    model_opt = optimize_for_inference(model_opt, csr_aggregation=True)
+
+    output = model(create_batch("cpu"))
+    output_opt = model_opt(data=create_batch("cpu"))
+    for interaction in model_opt.interactions:
+        assert not hasattr(interaction, "edge_csr")
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+
+def test_edge_index_to_csr():
+    batch = create_batch("cpu")
+    num_nodes = batch["node_attrs"].shape[0]
+    edge_csr = edge_index_to_csr(
+        batch["edge_index"], num_nodes=num_nodes, dtype=torch.float64
+    )
+    assert edge_csr.layout == torch.sparse_csr
+    assert edge_csr.col_indices().dtype == torch.int32
+    # every row sums the messages received by one node
+    ones = torch.ones(batch["edge_index"].shape[1], 1, dtype=torch.float64)
+    expected = torch.bincount(batch["edge_index"][1], minlength=num_nodes)
+    assert_close(torch.mm(edge_csr, ones).squeeze(-1), expected.double())
+
+
+def test_optimize_bfloat16_linears():
+    with tools.torch_tools.default_dtype(torch.float32):
+        model = create_mace("cpu")
+        model_opt = optimize_for_inference(
+            deepcopy(model), linear_dtype=torch.bfloat16
+        )
+        assert model_opt.node_embedding.linear.weight.dtype == torch.bfloat16
+        assert next(model_opt.parameters()).dtype == torch.float32
+
+        output = model(create_batch("cpu"))
+        output_opt = model_opt(create_batch("cpu"))
+        assert output_opt["energy"].dtype == torch.float32
+        assert_close(output_opt["energy"], output["energy"], rtol=1e-2, atol=1e-2)
+
+
+def test_optimize_bfloat16_spherical_harmonics():
+    with tools.torch_tools.default_dtype(torch.float32):
+        model = create_mace("cpu")
+        model_opt = optimize_for_inference(deepcopy(model), sh_dtype=torch.bfloat16)
+
+        output = model(create_batch("cpu"))
+        output_opt = model_opt(create_batch("cpu"))
+        assert output_opt["forces"].dtype == torch.float32
+        assert_close(output_opt["energy"], output["energy"], rtol=5e-2, atol=5e-2)
+
+
+def test_optimize_fused_spherical_harmonics(default_dtype):
+    model = create_mace("cpu")
+    model_opt = optimize_for_inference(deepcopy(model), fuse_sh=True)
+
+    output = model(create_batch("cpu"))
+    output_opt = model_opt(create_batch("cpu"))
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="cuda is not available")
+def test_optimize_streams(default_dtype):
+    model = create_mace("cuda")
+    model_opt = optimize_for_inference(deepcopy(model), use_streams=True)
+    output = model(create_batch("cuda"))
+    output_opt = model_opt(create_batch("cuda"))
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+    # the streams are not part of the module state
+    buffer = io.BytesIO()
+    torch.save(deepcopy(model_opt), buffer)
+    buffer.seek(0)
+    model_loaded = torch.load(buffer)
+    output_loaded = model_loaded(create_batch("cuda"))
+    assert_close(output_loaded["energy"], output["energy"])
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="cuda is not available")
+def test_optimize_oeq(default_dtype):
+    pytest.importorskip("openequivariance")
+    model = create_mace("cuda")
+    model_opt = optimize_for_inference(deepcopy(model), use_oeq=True)
+    output = model(create_batch("cuda"))
+    output_opt = model_opt(create_batch("cuda"))
+    assert_close(output_opt["energy"], output["energy"])
+    assert_close(output_opt["forces"], output["forces"])
+
+
+def test_prefetch_to_device():
+    dataset = [
+        data.AtomicData.from_config(
+            data.config_from_atoms(build.bulk("C", "diamond", a=3.567, cubic=True)),
+            z_table=table,
+            cutoff=cutoff,
+        )
+        for _ in range(3)
+    ]
+    data_loader = torch_geometric.dataloader.DataLoader(
+        dataset=dataset, batch_size=2, shuffle=False, drop_last=False
+    )
+    batches = list(prefetch_to_device(data_loader, torch.device("cpu")))
+    assert [batch.num_graphs for batch in batches] == [2, 1]
+    if torch.cuda.is_available():
+        batches_cuda = list(prefetch_to_device(data_loader, torch.device("cuda")))
+        for batch, batch_cuda in zip(batches, batches_cuda):
+            assert batch_cuda.positions.is_cuda
+            assert_close(batch_cuda.positions.cpu(), batch.positions)
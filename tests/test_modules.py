@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import torch
 import torch.nn.functional
 from e3nn import o3
@@ -12,6 +13,7 @@ from mace.modules import (
     WeightedEnergyForcesLoss,
     WeightedHuberEnergyForcesStressLoss,
 )
+from mace.modules.utils import compute_forces_virials
 from mace.tools import AtomicNumberTable, scatter, to_numpy, torch_geometric
 
 config = Configuration(
@@ -110,3 +112,27 @@ class TestBlocks:
         out = scatter.scatter_sum(src=energies, index=batch.batch, dim=-1, reduce="sum")
         out = to_numpy(out)
         assert np.allclose(out, np.array([5.0, 5.0]))
+
+
+class TestUtils:
+    @pytest.mark.parametrize(
+        "device", ["cpu"] + (["cuda"] if torch.cuda.is_available() else [])
+    )
+    def test_virials_fallback(self, device):
+        # an energy independent of the cell (e.g. no edges) has no virials gradient
+        positions = torch.randn(4, 3, device=device, requires_grad=True)
+        displacement = torch.zeros(2, 3, 3, device=device, requires_grad=True)
+        cell = torch.eye(3, device=device).repeat(2, 1)
+        energy = torch.stack([positions[:2].sum(), positions[2:].sum()])
+
+        forces, virials, _ = compute_forces_virials(
+            energy=energy,
+            positions=positions,
+            displacement=displacement,
+            cell=cell,
+            training=False,
+        )
+        assert forces.shape == positions.shape
+        assert virials.shape == (2, 3, 3)
+        assert virials.device == displacement.device
+        assert torch.all(virials == 0.0)